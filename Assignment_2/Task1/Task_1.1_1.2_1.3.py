@@ -2,10 +2,11 @@
 # Task 1.1 and 1.2: Wind Bidding Optimization Under One-Price and Two-Price imbalance
 # -----------------------------------------------------------------------------
 # This script optimizes 24-hour wind power bidding under one-price and
-# two-price imbalance pricing using Pyomo and Gurobi.
+# two-price imbalance pricing.
 #
 # Type:
-#     Linear optimization model (profit maximization)
+#     Linear optimization model (profit maximization), solved in closed form
+#     per hour on NumPy arrays
 #
 # Inputs:
 #     - Scenario list with hourly wind, DA price, and system imbalance
@@ -20,164 +21,72 @@
 # =============================================================================
 # Imports and Initialization
 # =============================================================================
-from pyomo.environ import *
-from pyomo.opt import SolverFactory
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scenarios import main
-import os
-import random
+from bidding_opt import IMBALANCE_FACTORS, imbalance_coefficients, scenario_revenue, solution_revenue, solve_bidding
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-# Set working directory to this script's folder
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+try:
+    import numba as nb
+except ImportError:  # evaluate_profit falls back to the NumPy kernel
+    nb = None
 
-# Load and shuffle all scenarios
-all_scenarios = main()  # Load scenarios from the scenarios module
-random.seed(42) # Set seed for reproducibility
-random.shuffle(all_scenarios)
-
-# Select 200 in-sample scenarios for optimization
-in_sample = all_scenarios[:200] 
 T = range(24)
-S = range(len(in_sample))
-max_capacity = 500  # Max bidding quantity in MW
-
-# =============================================================================
-# Step 1: Create Model Template (No Objective Yet)
-# =============================================================================
-def create_model_template(in_sample):
-    """
-    Build Pyomo model structure with variables and constraints,
-    excluding the objective function.
-
-    Parameters:
-    - in_sample (list): Scenario data with wind, price_da, system flags
-
-    Returns:
-    - ConcreteModel: Pyomo optimization model
-    """
-    model = ConcreteModel()
-    model.T = Set(initialize=range(24))
-    model.S = Set(initialize=range(len(in_sample)))
-
-    # Decision variables
-    model.offer_quantity = Var(model.T, domain=NonNegativeReals, bounds=(0, max_capacity))
-    model.delta = Var(model.S, model.T, domain=Reals)
-    model.delta_exc = Var(model.S, model.T, domain=NonNegativeReals)
-    model.delta_def = Var(model.S, model.T, domain=NonNegativeReals)
+PLOT = True  # Set to False to skip all figures (e.g. for timing runs)
 
-    # Constraint: Imbalance definition (wind - offer)
-    def imbalance_def_rule(m, s, t):
-        return m.delta[s, t] == in_sample[s]["wind"][t] - m.offer_quantity[t]
-    model.ImbalanceDef = Constraint(model.S, model.T, rule=imbalance_def_rule)
-
-    # Constraint: Decompose delta into up/down parts
-    def delta_decomp_rule(m, s, t):
-        return m.delta[s, t] == m.delta_exc[s, t] - m.delta_def[s, t]
-    model.DeltaDecomp = Constraint(model.S, model.T, rule=delta_decomp_rule)
-
-    return model
+# Apply the plot style once instead of in every plotting call
+sns.set(style="whitegrid")
 
 # =============================================================================
-# Step 2: Solve Model and Extract Results
+# Step 1: Solve Bidding Problem and Extract Results
 # =============================================================================
-def solve_and_extract(scheme: str, in_sample, solver, return_only=False):
+def solve_and_extract(scheme: str, in_sample, return_only=False):
     """
     Solve wind bidding optimization for a given pricing scheme.
 
     Parameters:
     - scheme (str): 'one' or 'two' price imbalance scheme
-    - in_sample (list): Scenario set
-    - solver: Pyomo solver object
+    - in_sample (ScenarioSet): Scenario set
     - return_only (bool): If True, return strategy only
 
     Returns:
     - DataFrame or (list, float): Hourly bid and revenue info, or strategy
     """
-    model = create_model_template(in_sample)
-
-    # Define expected revenue objective
-    def revenue(m):
-        return (1 / len(in_sample)) * sum(
-            sum(
-                in_sample[s]["price_da"][t] * m.offer_quantity[t]
-                + (
-                    (0.85 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                     - 0.85 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * in_sample[s]["system"][t]
-                    if scheme == "one"
-                    else (0.85 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                          - in_sample[s]["price_da"][t] * m.delta_def[s, t]) * in_sample[s]["system"][t]
-                )
-                + (
-                    (1.25 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                     - 1.25 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * (1 - in_sample[s]["system"][t])
-                    if scheme == "one"
-                    else (in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                          - 1.25 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * (1 - in_sample[s]["system"][t])
-                )
-                for s in range(len(in_sample))
-            ) for t in range(24)
-        )
-
-    model.ExpectedRevenue = Objective(rule=revenue, sense=maximize)
-
-    # Solve using Gurobi
-    solver = SolverFactory('gurobi')  
+    wind, price_da = in_sample.wind, in_sample.price_da
+
     start_time = time.time()
-    result = solver.solve(model, tee=True)
+    result = solve_bidding(wind, price_da, in_sample.system, scheme)
     solve_time = time.time() - start_time
     print(f"\nSolving time for {scheme}-price scheme: {solve_time:.2f} seconds")
 
-    if (result.solver.status == SolverStatus.ok) and (result.solver.termination_condition == TerminationCondition.optimal):
-        offer_quantities = [value(model.offer_quantity[t]) for t in range(24)]
-        expected_profit = value(model.ExpectedRevenue)
+    offer_quantities = result.offer
+    expected_profit = result.objective
 
-        if return_only:
-            return offer_quantities, expected_profit
-        else:
-            print("\nOptimal Offer Quantities:")
-            for t in T:
-                print(f"Hour {t}: Offer {value(model.offer_quantity[t]):.2f} MW")
-            print(f"\nExpected Profit: {expected_profit:.2f} €")
+    if return_only:
+        return offer_quantities.tolist(), expected_profit
+    else:
+        print("\nOptimal Offer Quantities:")
+        for t in T:
+            print(f"Hour {t}: Offer {offer_quantities[t]:.2f} MW")
+        print(f"\nExpected Profit: {expected_profit:.2f} €")
 
     # Collect hourly bidding and revenue info
-    data = []
-    for t in range(24):
-        bid = offer_quantities[t]
-        total_revenue = 0
-        for s in range(len(in_sample)):
-            p_da = in_sample[s]["price_da"][t]
-            delta_up = value(model.delta_exc[s, t])
-            delta_down = value(model.delta_def[s, t])
-            system_flag = in_sample[s]["system"][t]
-
-            if scheme == "one":
-                revenue = (
-                    p_da * bid + 0.85 * p_da * delta_up - 0.85 * p_da * delta_down
-                    if system_flag == 1 else 1.25 * p_da * delta_up - 1.25 * p_da * delta_down
-                )
-            else:
-                revenue = (
-                    p_da * bid + 0.85 * p_da * delta_up - p_da * delta_down
-                    if system_flag == 1 else p_da * delta_up - 1.25 * p_da * delta_down
-                )
-            total_revenue += revenue
-
-        avg_revenue = total_revenue / len(in_sample)
-        data.append({
-            "hour": t,
-            "bid_MW": bid,
-            "expected_revenue_€": avg_revenue,
-            "scheme": "One-Price" if scheme == "one" else "Two-Price"
-        })
-
-    return pd.DataFrame(data)
+    _, hourly_revenue = solution_revenue(offer_quantities, price_da, result.coef_exc, result.coef_def,
+                                         result.delta_exc, result.delta_def)
+    return pd.DataFrame({
+        "hour": np.arange(24),
+        "bid_MW": offer_quantities,
+        "expected_revenue_€": hourly_revenue,
+        "scheme": "One-Price" if scheme == "one" else "Two-Price"
+    })
 
 # =============================================================================
-# Step 3: Plot Bidding and Revenue Comparison
+# Step 2: Plot Bidding and Revenue Comparison
 # =============================================================================
 def plot_bid_and_revenue_comparison(df_combined):
     """
@@ -187,7 +96,6 @@ def plot_bid_and_revenue_comparison(df_combined):
     Parameters:
     - df_combined (DataFrame): Combined results from both schemes
     """
-    sns.set(style="whitegrid")
     fig, ax1 = plt.subplots(figsize=(12, 6))
 
     # Barplot for bids
@@ -206,21 +114,28 @@ def plot_bid_and_revenue_comparison(df_combined):
     # Separate legends
     ax1.legend(loc='upper left')
     ax2.legend(loc='upper right')
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
 
 # =============================================================================
 # Run Optimization and Visualization
 # =============================================================================
-solver = SolverFactory("gurobi")
+# Guarded so that worker processes of the cross-validation pool can import this module
+if __name__ == "__main__":
+    # Load all scenarios
+    all_scenarios = main()  # Load scenarios from the scenarios module
+    rng = np.random.default_rng(42) # Seeded generator for reproducibility
+
+    # Draw 200 in-sample scenarios for optimization (indices without replacement)
+    in_sample = all_scenarios.subset(rng.choice(len(all_scenarios), 200, replace=False))
 
-# Run optimization for both schemes
-df_one = solve_and_extract("one", in_sample, solver)
-df_two = solve_and_extract("two", in_sample, solver)
+    # Run optimization for both schemes
+    df_one = solve_and_extract("one", in_sample)
+    df_two = solve_and_extract("two", in_sample)
 
-# Combine results and plot
-df_combined = pd.concat([df_one, df_two], ignore_index=True)
-plot_bid_and_revenue_comparison(df_combined)
+    # Combine results and plot
+    df_combined = pd.concat([df_one, df_two], ignore_index=True)
+    if PLOT:
+        plot_bid_and_revenue_comparison(df_combined)
 
 
 # =============================================================================
@@ -231,6 +146,40 @@ plot_bid_and_revenue_comparison(df_combined)
 # of in-sample scenario sets under one- or two-price market schemes.
 # =============================================================================
 
+if nb is not None:
+    @nb.njit(parallel=True, fastmath=True, cache=True)
+    def evaluate_profit_core(wind, price_da, system, bid, factors_exc, factors_def):
+        """
+        Average profit of a fixed bid over stacked scenarios (compiled with Numba).
+
+        Parameters:
+            wind, price_da, system (np.ndarray): Stacked scenario data (N x 24).
+            bid (np.ndarray): 24 hourly bids (MW).
+            factors_exc, factors_def (np.ndarray): Balancing price factors of the pricing
+                scheme indexed by the system flag (see IMBALANCE_FACTORS).
+
+        Returns:
+            float: Average profit over all scenarios.
+        """
+        n = wind.shape[0]
+        profits = np.empty(n)
+        for s in nb.prange(n):
+            profit = 0.0
+            for t in range(24):
+                p_da = price_da[s, t]
+                imbalance = wind[s, t] - bid[t]
+
+                # Excess wind is paid, a deficit (imbalance < 0) is charged
+                if imbalance >= 0:
+                    coef = factors_exc[system[s, t]]
+                else:
+                    coef = factors_def[system[s, t]]
+
+                profit += p_da * bid[t] + coef * p_da * imbalance
+            profits[s] = profit
+        return profits.mean()
+
+
 def evaluate_profit(offer_quantities, scenarios, scheme):
     """
     Evaluate the average profit of a fixed bidding strategy over a set of scenarios.
@@ -240,45 +189,45 @@ def evaluate_profit(offer_quantities, scenarios, scheme):
 
     Parameters:
         offer_quantities (list of float): List of 24 bid values for each hour.
-        scenarios (list of dict): Scenario data containing 'wind', 'price_da', and 'system' keys.
+        scenarios (ScenarioSet): Scenario data with wind, price_da, and system arrays.
         scheme (str): Market scheme, either 'one' or 'two' for one-price or two-price imbalance.
 
     Returns:
         float: Average profit over all scenarios.
     """
-    total_profit = 0
-
-    for s in scenarios:
-        scenario_profit = 0
-        for t in range(24):
-            bid = offer_quantities[t]
-            wind = s["wind"][t]
-            p_da = s["price_da"][t]
-            system_flag = s["system"][t]
-
-            imbalance = wind - bid
-
-            if imbalance >= 0:
-                # Excess wind
-                if scheme == "one":
-                    revenue = p_da * bid + (0.85 if system_flag == 1 else 1.25) * p_da * imbalance
-                else:
-                    revenue = p_da * bid + (0.85 if system_flag == 1 else 1.00) * p_da * imbalance
-            else:
-                # Deficit
-                deficit = -imbalance
-                if scheme == "one":
-                    revenue = p_da * bid - (0.85 if system_flag == 1 else 1.25) * p_da * deficit
-                else:
-                    revenue = p_da * bid - (1.00 if system_flag == 1 else 1.25) * p_da * deficit
+    wind, price_da, system = scenarios.wind, scenarios.price_da, scenarios.system
+    if nb is not None:
+        bid = np.asarray(offer_quantities, dtype=float)
+        return evaluate_profit_core(wind, price_da, system, bid, *IMBALANCE_FACTORS[scheme])
+
+    coef_exc, coef_def = imbalance_coefficients(price_da, system, scheme)
+    revenue = scenario_revenue(offer_quantities, wind, price_da, coef_exc, coef_def)
+    return revenue.sum(axis=1).mean()
+
 
-            scenario_profit += revenue
-        total_profit += scenario_profit
+def _init_fold_worker():
+    """Limit each pool worker to one Numba thread so workers do not oversubscribe the cores."""
+    if nb is not None:
+        nb.set_num_threads(1)
+
+
+def _run_one_fold(job):
+    """
+    Train on one fold and evaluate the strategy on the remaining folds.
+
+    Parameters:
+        job (tuple): (in_sample, out_sample, scheme) with ScenarioSet data.
 
-    return total_profit / len(scenarios)
+    Returns:
+        tuple: In-sample profit and out-of-sample profit.
+    """
+    in_sample, out_sample, scheme = job
+    offer_quantities, in_profit = solve_and_extract(scheme, in_sample, return_only=True)
+    out_profit = evaluate_profit(offer_quantities, out_sample, scheme)
+    return in_profit, out_profit
 
 
-def run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme="one", solver=None):
+def run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme="one", n_workers=1):
     """
     Perform k-fold cross-validation for different in-sample scenario sizes.
 
@@ -287,10 +236,10 @@ def run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme="one",
     between in-sample and out-of-sample profits.
 
     Parameters:
-        all_scenarios (list): Complete scenario dataset.
+        all_scenarios (ScenarioSet): Complete scenario dataset.
         in_sample_sizes (list): List of in-sample scenario sizes to test.
         scheme (str): Market imbalance pricing scheme ('one' or 'two').
-        solver (SolverFactory): Pyomo solver used to solve the optimization model.
+        n_workers (int): Number of processes solving folds in parallel (1 = sequential).
 
     Returns:
         pd.DataFrame: Summary of average in-sample profit, out-of-sample profit,
@@ -304,29 +253,39 @@ def run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme="one",
         print("=" * 40)
 
         num_folds = len(all_scenarios) // in_sample_size
-        scenarios_copy = all_scenarios[:] # Make a copy to avoid modifying the original list
-        random.seed(42) # Set seed for reproducibility
-        random.shuffle(scenarios_copy) # Shuffle the scenarios
+        rng = np.random.default_rng(42) # Seeded generator for reproducibility
+        order = rng.permutation(len(all_scenarios)) # Shuffle the scenario indices
 
-        # Split data into folds of the given in-sample size
-        folds = [
-            scenarios_copy[i * in_sample_size : (i + 1) * in_sample_size]
-            for i in range(num_folds)
-        ]
+        # Assign the shuffled scenario indices to folds of the given in-sample size
+        order = order[: num_folds * in_sample_size]
+        fold_of = np.repeat(np.arange(num_folds), in_sample_size)
         # Initialize lists to store profits
         in_sample_profits = []
         out_sample_profits = []
 
-        # Perform k-fold cross-validation
-        for i in range(num_folds):
-            print(f"\n  Running Fold {i+1}/{num_folds}...")
+        # Train on one fold, evaluate on the rest
+        jobs = [
+            (
+                all_scenarios.subset(order[fold_of == i]),
+                all_scenarios.subset(order[fold_of != i]),
+                scheme,
+            )
+            for i in range(num_folds)
+        ]
 
-            in_sample = folds[i]
-            out_sample = [s for j, fold in enumerate(folds) if j != i for s in fold]
+        # Perform k-fold cross-validation (folds are independent). Workers are spawned,
+        # not forked: forking after the parallel Numba kernels have run in this process
+        # deadlocks under Numba's TBB threading layer
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=min(n_workers, num_folds),
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_fold_worker) as executor:
+                fold_results = list(executor.map(_run_one_fold, jobs))
+        else:
+            fold_results = map(_run_one_fold, jobs)
 
-            # Train on one fold, evaluate on the rest
-            offer_quantities, in_profit = solve_and_extract(scheme, in_sample, solver, return_only=True)
-            out_profit = evaluate_profit(offer_quantities, out_sample, scheme)
+        for i, (in_profit, out_profit) in enumerate(fold_results):
+            print(f"\n  Fold {i+1}/{num_folds}:")
 
             in_sample_profits.append(in_profit)
             out_sample_profits.append(out_profit)
@@ -357,21 +316,27 @@ def run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme="one",
 # Execute Cross-Validation and Plot
 # =============================================================================
 
-in_sample_sizes = [100, 200, 400, 800]  # Scenario sizes to test
-scheme = "two"  # Pricing scheme to evaluate, can be "one" or "two"
-
-# Run cross-validation
-results_df = run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme, solver)
-
-# Display results
-print("\n=== All Results ===")
-print(results_df)
-
-# Plot generalization gap
-plt.figure(figsize=(8, 4.5))
-plt.plot(results_df["In-Sample Size"], results_df["Generalization Gap"], marker='d', color='crimson')
-plt.xlabel("In-Sample Size")
-plt.ylabel("Generalization Gap (€)")
-plt.grid(True)
-plt.tight_layout()
-# plt.show() # Uncomment to display the plot
+if __name__ == "__main__":
+    in_sample_sizes = [100, 200, 400, 800]  # Scenario sizes to test
+    scheme = "two"  # Pricing scheme to evaluate, can be "one" or "two"
+    n_workers = 1  # Parallel processes for the folds, e.g. multiprocessing.cpu_count()
+
+    # Run cross-validation
+    results_df = run_cross_validation_for_sizes(all_scenarios, in_sample_sizes, scheme, n_workers)
+
+    # Display results
+    print("\n=== All Results ===")
+    print(results_df)
+
+    # Plot generalization gap
+    if PLOT:
+        plt.figure(figsize=(8, 4.5))
+        plt.plot(results_df["In-Sample Size"], results_df["Generalization Gap"], marker='d', color='crimson')
+        plt.xlabel("In-Sample Size")
+        plt.ylabel("Generalization Gap (€)")
+        plt.grid(True)
+        plt.tight_layout()
+
+        # Show all figures once the computations are done, so that the
+        # cross-validation does not wait for the first plot window to close
+        plt.show()
@@ -21,265 +21,93 @@
 # =============================================================================
 # Imports and Initialization
 # =============================================================================
-from pyomo.environ import *
-from pyomo.opt import SolverFactory
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scenarios import main
+from bidding_opt import solution_revenue, solve_bidding
 import os
-import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-# Set working directory to script location
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-# Load data
-all_scenarios = main()
-random.seed(42)  # For reproducibility
-random.shuffle(all_scenarios)
-
-in_sample = all_scenarios[:200]
 T = range(24)
-S = range(len(in_sample))
-max_capacity = 500
-
-# =============================================================================
-# Step 1: Create Model Template
-# =============================================================================
-def create_model_template(scheme, in_sample):
-    """
-    Create a Pyomo model for wind bidding optimization with CVaR-based risk management.
-
-    This model includes variables for the bidding decision and imbalance handling,
-    along with constraints for imbalance definition, decomposition, and the CVaR auxiliary structure.
+PLOT = True  # Set to False to skip all figures (e.g. for timing runs)
 
-    Parameters:
-        scheme (str): Pricing scheme used, either 'one' or 'two' (one-price or two-price imbalance market).
-        in_sample (list): List of scenario dictionaries, each containing 'wind', 'price_da', and 'system' keys.
-
-    Returns:
-        ConcreteModel: A Pyomo model instance with sets, variables, and constraints (excluding objective).
-    """
-    model = ConcreteModel()
-    
-    # Sets for time periods and scenarios
-    model.T = Set(initialize=range(24))
-    model.S = Set(initialize=range(len(in_sample)))
-
-    # Decision variable: DA offer quantity per hour (bounded by max capacity)
-    model.offer_quantity = Var(model.T, domain=NonNegativeReals, bounds=(0, max_capacity))
-    
-    # Scenario-dependent imbalance variables: net imbalance = wind - offer
-    model.delta = Var(model.S, model.T, domain=Reals)
-    
-    # Positive and negative parts of imbalance
-    model.delta_exc = Var(model.S, model.T, domain=NonNegativeReals)  # Excess (overproduction)
-    model.delta_def = Var(model.S, model.T, domain=NonNegativeReals)  # Deficit (underproduction)
-
-    # CVaR components: VaR threshold and auxiliary shortfall variables
-    model.VaR = Var(domain=NonNegativeReals)
-    model.auxiliary = Var(model.S, domain=NonNegativeReals)
-
-    # Constraint: delta = wind - offer
-    def imbalance_def_rule(m, s, t):
-        return m.delta[s, t] == in_sample[s]["wind"][t] - m.offer_quantity[t]
-    model.ImbalanceDef = Constraint(model.S, model.T, rule=imbalance_def_rule)
-
-    # Constraint: decompose delta into delta_exc - delta_def
-    def delta_decomp_rule(m, s, t):
-        return m.delta[s, t] == m.delta_exc[s, t] - m.delta_def[s, t]
-    model.DeltaDecomp = Constraint(model.S, model.T, rule=delta_decomp_rule)
-
-    # CVaR constraint: auxiliary ≥ VaR - scenario profit (for each scenario and time)
-    def auxiliary_rule(m, s, t):
-        return m.auxiliary[s] >= m.VaR - sum(
-            in_sample[s]["price_da"][t] * m.offer_quantity[t]
-            + (
-                (0.85 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                 - 0.85 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * in_sample[s]["system"][t]
-                if scheme == "one"
-                else (0.85 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                      - in_sample[s]["price_da"][t] * m.delta_def[s, t]) * in_sample[s]["system"][t]
-            )
-            + (
-                (1.25 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                 - 1.25 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * (1 - in_sample[s]["system"][t])
-                if scheme == "one"
-                else (in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                      - 1.25 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * (1 - in_sample[s]["system"][t])
-            )
-            for t in range(24)
-        )
-    model.Auxiliary = Constraint(model.S, model.T, rule=auxiliary_rule)
-
-    return model
+# Apply the plot style once instead of in every plotting call
+sns.set(style="whitegrid")
 
 # =============================================================================
-# Step 2: Solve Model and Extract Results
+# Step 1: Solve Model and Extract Results
 # =============================================================================
-def solve_and_extract(scheme: str, beta, in_sample, solver, return_only=False, alpha=0.90):
+def solve_and_extract(scheme: str, beta, in_sample, return_only=False, alpha=0.90, active=None):
     """
     Solve the CVaR-based wind bidding optimization model and extract key metrics.
 
     This function sets up the objective using a combination of expected profit and 
-    Conditional Value-at-Risk (CVaR), solves the model using the specified solver, 
+    Conditional Value-at-Risk (CVaR), solves the model with Gurobi, 
     and returns hourly bids, expected revenue, CVaR, and per-scenario profit data.
 
     Parameters:
         scheme (str): 'one' or 'two' for one-price or two-price imbalance pricing.
         beta (float): Risk aversion level (0 = risk-neutral, 1 = fully risk-averse).
-        in_sample (list): List of scenario dictionaries containing wind, price_da, and system flags.
-        solver: A Pyomo solver object (e.g., SolverFactory('gurobi')).
-        return_only (bool): If True, return only optimal bids and expected profit.
+        in_sample (ScenarioSet): Scenario data with wind, price_da, and system arrays.
+        return_only (bool): If True, return only optimal bids, expected revenue and CVaR.
         alpha (float): CVaR quantile (default is 0.90 for 90% confidence).
+        active (np.ndarray, optional): Boolean mask of the scenarios of in_sample to
+            optimize over; all scenarios by default.
 
     Returns:
-        pd.DataFrame: Hourly bid and expected revenue data.
+        pd.DataFrame: Hourly bid and expected revenue data (list of bids if return_only).
         float: Expected revenue over in-sample scenarios.
         float: Conditional Value-at-Risk (CVaR) value.
-        list: Profit per scenario.
+        np.ndarray: Profit per scenario (omitted if return_only).
     """
-    # Build model using in-sample data and pricing scheme
-    model = create_model_template(scheme, in_sample)
-
-    # Define the CVaR-based objective function: weighted sum of expected profit and downside risk
-    def revenue(m):
-        return (1 - beta) * ((1 / len(in_sample)) * sum(
-            sum(
-                in_sample[s]["price_da"][t] * m.offer_quantity[t]
-                + (
-                    (0.85 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                     - 0.85 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * in_sample[s]["system"][t]
-                    if scheme == "one"
-                    else (0.85 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                          - in_sample[s]["price_da"][t] * m.delta_def[s, t]) * in_sample[s]["system"][t]
-                )
-                + (
-                    (1.25 * in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                     - 1.25 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * (1 - in_sample[s]["system"][t])
-                    if scheme == "one"
-                    else (in_sample[s]["price_da"][t] * m.delta_exc[s, t]
-                          - 1.25 * in_sample[s]["price_da"][t] * m.delta_def[s, t]) * (1 - in_sample[s]["system"][t])
-                )
-                for s in range(len(in_sample))
-            ) for t in range(24)
-        )) + beta * (m.VaR - 1 / (1 - alpha) * sum(
-            (1 / len(in_sample)) * m.auxiliary[s] for s in range(len(in_sample))
-        ))
-
-    # Set objective in model
-    model.ExpectedRevenue = Objective(rule=revenue, sense=maximize)
-
-    # Solve the model
-    solver = SolverFactory('gurobi')  
-    result = solver.solve(model, tee=False)
-
-    # If solved successfully, extract offer quantities and expected profit
-    if (result.solver.status == SolverStatus.ok) and (result.solver.termination_condition == TerminationCondition.optimal):
-        offer_quantities = [value(model.offer_quantity[t]) for t in range(24)]
-        expected_profit = value(model.ExpectedRevenue)
-
-        # Option to return only strategy and expected profit (e.g. for cross-validation)
-        if return_only:
-            return offer_quantities, expected_profit
-
-    # Collect hourly bidding and revenue data
-    data = []
-    for t in range(24):
-        bid = offer_quantities[t]
-        total_revenue = 0
-        for s in range(len(in_sample)):
-            p_da = in_sample[s]["price_da"][t]
-            delta_up = value(model.delta_exc[s, t])
-            delta_down = value(model.delta_def[s, t])
-            system_flag = in_sample[s]["system"][t]
-
-            # Revenue logic depends on scheme and system direction
-            if scheme == "one":
-                revenue = (
-                    p_da * bid
-                    + 0.85 * p_da * delta_up
-                    - 0.85 * p_da * delta_down if system_flag == 1
-                    else 1.25 * p_da * delta_up - 1.25 * p_da * delta_down
-                )
-            else:
-                revenue = (
-                    p_da * bid
-                    + 0.85 * p_da * delta_up
-                    - p_da * delta_down if system_flag == 1
-                    else p_da * delta_up - 1.25 * p_da * delta_down
-                )
-            total_revenue += revenue
-
-        avg_revenue = total_revenue / len(in_sample)
-
-        # Store for plotting
-        data.append({
-            "hour": t,
-            "bid_MW": bid,
-            "expected_revenue_€": avg_revenue,
-            "scheme": "One-Price" if scheme == "one" else "Two-Price"
-        })
+    # Solve the CVaR model (cached Gurobi template, reused across schemes, betas and masks)
+    result = solve_bidding(in_sample.wind, in_sample.price_da, in_sample.system, scheme,
+                           cvar=True, beta=beta, alpha=alpha, active=active)
+    price_da = in_sample.price_da if active is None else in_sample.price_da[active]
+    offer_quantities = result.offer.tolist()
 
     # Compute CVaR from auxiliary variables
-    cvar = value(model.VaR) - (1 / (1 - alpha)) * sum((1 / len(in_sample)) *
-        value(model.auxiliary[s]) for s in range(len(in_sample))
-    )
-
-    # Compute expected revenue based on actual model output (not objective value)
-    expected_revenue = (1 / len(in_sample)) * sum(
-        sum(
-            in_sample[s]["price_da"][t] * value(model.offer_quantity[t])
-            + (
-                (0.85 * in_sample[s]["price_da"][t] * value(model.delta_exc[s, t])
-                 - 0.85 * in_sample[s]["price_da"][t] * value(model.delta_def[s, t])) * in_sample[s]["system"][t]
-                if scheme == "one"
-                else (0.85 * in_sample[s]["price_da"][t] * value(model.delta_exc[s, t])
-                      - in_sample[s]["price_da"][t] * value(model.delta_def[s, t])) * in_sample[s]["system"][t]
-            )
-            + (
-                (1.25 * in_sample[s]["price_da"][t] * value(model.delta_exc[s, t])
-                 - 1.25 * in_sample[s]["price_da"][t] * value(model.delta_def[s, t])) * (1 - in_sample[s]["system"][t])
-                if scheme == "one"
-                else (in_sample[s]["price_da"][t] * value(model.delta_exc[s, t])
-                      - 1.25 * in_sample[s]["price_da"][t] * value(model.delta_def[s, t])) * (1 - in_sample[s]["system"][t])
-            )
-            for t in range(24)
-        ) for s in range(len(in_sample))
-    )
+    cvar = result.var - result.aux.mean() / (1 - alpha)
+
+    # Option to return only strategy, expected revenue and CVaR (e.g. for the sweep).
+    # The objective is (1 - beta) * expected revenue + beta * CVaR, so the expected
+    # revenue follows from the objective value without any post-processing.
+    if return_only and beta < 1:
+        expected_revenue = (result.objective - beta * cvar) / (1 - beta)
+        print(f"Expected Revenue: {expected_revenue:.2f} €, CVaR: {cvar:.2f} €")
+        return offer_quantities, expected_revenue, cvar
+
+    # Extract imbalance values (and the imbalance prices of the model) as arrays
+    coef_exc, coef_def = result.coef_exc, result.coef_def
+    delta_exc, delta_def = result.delta_exc, result.delta_def
+
+    # Scenario-wise profit and mean hourly revenue (actual model output, not objective value)
+    bid = np.asarray(offer_quantities)
+    profits, hourly_revenue = solution_revenue(bid, price_da, coef_exc, coef_def, delta_exc, delta_def)
+
+    # Compute expected revenue from the scenario profits
+    expected_revenue = profits.mean()
 
     print(f"Expected Revenue: {expected_revenue:.2f} €, CVaR: {cvar:.2f} €")
+    if return_only:
+        return offer_quantities, expected_revenue, cvar
 
-    # Scenario-wise profit computation
-    profits_per_scenario = []
-    for s in range(len(in_sample)):
-        profit_s = 0
-        for t in range(24):
-            p_da = in_sample[s]["price_da"][t]
-            delta_up = value(model.delta_exc[s, t])
-            delta_down = value(model.delta_def[s, t])
-            bid = value(model.offer_quantity[t])
-            system_flag = in_sample[s]["system"][t]
-
-            if scheme == "one":
-                if system_flag == 1:
-                    profit_s += p_da * bid + 0.85 * p_da * delta_up - 0.85 * p_da * delta_down
-                else:
-                    profit_s += p_da * bid + 1.25 * p_da * delta_up - 1.25 * p_da * delta_down
-            else:
-                if system_flag == 1:
-                    profit_s += p_da * bid + 0.85 * p_da * delta_up - p_da * delta_down
-                else:
-                    profit_s += p_da * bid + p_da * delta_up - 1.25 * p_da * delta_down
-
-        profits_per_scenario.append(profit_s)
-
-    return pd.DataFrame(data), expected_revenue, cvar, profits_per_scenario
+    # Collect hourly bidding and revenue data
+    data = pd.DataFrame({
+        "hour": np.arange(24),
+        "bid_MW": bid,
+        "expected_revenue_€": hourly_revenue,
+        "scheme": "One-Price" if scheme == "one" else "Two-Price"
+    })
+
+    return data, expected_revenue, cvar, profits
 
 
 # =============================================================================
-# Step 3: plot and compare results
+# Step 2: plot and compare results
 # =============================================================================
 def plot_bid_and_revenue_comparison(df_combined):
     """
@@ -296,7 +124,6 @@ def plot_bid_and_revenue_comparison(df_combined):
             - expected_revenue_€
             - scheme (either 'One-Price' or 'Two-Price')
     """
-    sns.set(style="whitegrid")
     fig, ax1 = plt.subplots(figsize=(12, 6))
 
     # Bar plot: hourly bidding quantities
@@ -315,90 +142,130 @@ def plot_bid_and_revenue_comparison(df_combined):
     # Separate legends
     ax1.legend(loc='upper left')
     ax2.legend(loc='upper right')
-    plt.tight_layout()
-    plt.show()
-
-# Run everything
-solver = SolverFactory("gurobi")
-
-
-
-
-# Define in-sample sizes and beta values
-scenario_sizes = [100,200, 400,800, 1600] #Adjust to desired sizes
-betas = [0.5] #adjust to desired betas
-
-results = []
-
-# Run for each scenario size and beta
-for size in scenario_sizes:
-    sample = random.sample(all_scenarios, size)
-    for beta in betas:
-        print(f"\nSize: {size}, Beta: {beta:.2f}")
-        _, exp_rev_one, cvar_one, _ = solve_and_extract("one", beta, sample, solver)
-        _, exp_rev_two, cvar_two, _ = solve_and_extract("two", beta, sample, solver)
-
-        results.append({
-            "sample_size": size,
-            "beta": beta,
-            "expected_profit_one": exp_rev_one,
-            "cvar_one": cvar_one,
-            "expected_profit_two": exp_rev_two,
-            "cvar_two": cvar_two,
-        })
-
-# Convert results to DataFrame
-df = pd.DataFrame(results)
-
-# Filter for beta = 0.5 and scheme = "Two-Price"
-df_filtered = df[df["beta"] == 0.5]
-
-# Create simplified DataFrame for Two-Price only
-df_two_price = pd.DataFrame({
-    "sample_size": df_filtered["sample_size"],
-    "Expected Profit (€)": df_filtered["expected_profit_one"],
-    "CVaR (€)": df_filtered["cvar_one"]
-})
-
-# Sort by sample size just in case
-df_two_price = df_two_price.sort_values("sample_size")
-
-# Filter for beta = 0.5
-df_filtered = df[df["beta"] == 0.5]
-
-# Create DataFrame for Two-Price only
-df_two_price = pd.DataFrame({
-    "sample_size": df_filtered["sample_size"],
-    "Expected Profit (€)": df_filtered["expected_profit_one"],
-    "CVaR (€)": df_filtered["cvar_two"]
-}).sort_values("sample_size")
-
-# --- Plot Expected Profit ---
-plt.figure(figsize=(8, 5))
-sns.lineplot(data=df_two_price, x="sample_size", y="Expected Profit (€)",
-             marker="o", linewidth=2, color="steelblue")
-plt.title("Expected Profit vs In-Sample Size (Two-Price, β = 0.5)", fontsize=16)
-plt.xlabel("In-Sample Scenario Size", fontsize=20)
-plt.ylabel("Expected Profit (€)", fontsize=20)
-plt.xticks(fontsize=14)
-plt.yticks(fontsize=14)
-plt.grid(True)
-plt.tight_layout()
-#plt.show()  #Uncomment to show the plot
-
-# --- Plot CVaR ---
-plt.figure(figsize=(8, 5))
-sns.lineplot(data=df_two_price, x="sample_size", y="CVaR (€)",
-             marker="o", linewidth=2, color="darkred")
-plt.title("CVaR vs In-Sample Size (Two-Price, β = 0.5)", fontsize=16)
-plt.xlabel("In-Sample Scenario Size", fontsize=20)
-plt.ylabel("CVaR (€)", fontsize=20)
-plt.xticks(fontsize=14)
-plt.yticks(fontsize=14)
-plt.grid(True)
-plt.tight_layout()
-#plt.show() #Uncomment to show the plot
+    fig.tight_layout()
+
+# =============================================================================
+# Step 3: Sweep over in-sample sizes and risk aversion levels
+# =============================================================================
+def run_scheme_sweep(job):
+    """
+    Solve the CVaR model for all in-sample sizes and betas of one pricing scheme.
 
+    Each sample is a boolean mask over the full scenario set, so samples that cover a
+    large share of it are solved on one Gurobi model of all scenarios (see
+    solve_bidding); smaller samples get a model of their own. Betas are the inner loop,
+    so consecutive solves only change the objective.
 
+    Parameters:
+        job (tuple): (scheme, scenarios, samples, betas) with the pricing scheme, the
+            full ScenarioSet, a list of (size, mask) in-sample sets and the betas to solve.
 
+    Returns:
+        list of dict: One row per size and beta with the expected profit and CVaR.
+    """
+    scheme, scenarios, samples, betas = job
+    rows = []
+    for size, mask in samples:
+        for beta in betas:
+            print(f"\nSize: {size}, Beta: {beta:.2f}, Scheme: {scheme}")
+            _, exp_rev, cvar = solve_and_extract(scheme, beta, scenarios, return_only=True, active=mask)
+            rows.append({
+                "sample_size": size,
+                "beta": beta,
+                f"expected_profit_{scheme}": exp_rev,
+                f"cvar_{scheme}": cvar,
+            })
+    return rows
 
+# =============================================================================
+# Run Sweep and Visualization
+# =============================================================================
+# Guarded so that worker processes of the sweep pool can import this module
+if __name__ == "__main__":
+    # Load all scenarios
+    all_scenarios = main()
+    rng = np.random.default_rng(42)  # For reproducibility
+
+    # Define in-sample sizes and beta values
+    scenario_sizes = [100,200, 400,800, 1600] #Adjust to desired sizes
+    betas = [0.5] #adjust to desired betas
+    n_workers = os.cpu_count() or 1  # Parallel processes, at most one per pricing scheme
+
+    # Draw an independent random sample per size (indices without replacement), shared by
+    # both schemes and stored as a mask over all scenarios; largest first, so the model of
+    # all scenarios is built before the samples that reuse it
+    samples = []
+    for size in sorted(scenario_sizes, reverse=True):
+        mask = np.zeros(len(all_scenarios), dtype=bool)
+        mask[rng.choice(len(all_scenarios), size, replace=False)] = True
+        samples.append((size, mask))
+
+    # The pricing schemes are independent, each worker runs the full sweep of one scheme
+    jobs = [(scheme, all_scenarios, samples, betas) for scheme in ("one", "two")]
+    # Workers are spawned rather than forked, as in the Task 1.3 cross-validation
+    n_workers = min(n_workers, len(jobs))
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            scheme_rows = list(executor.map(run_scheme_sweep, jobs))
+    else:
+        scheme_rows = map(run_scheme_sweep, jobs)
+
+    # Merge the rows of both schemes into one row per size and beta
+    results = {}
+    for rows in scheme_rows:
+        for row in rows:
+            results.setdefault((row["sample_size"], row["beta"]), {}).update(row)
+    results = list(results.values())
+
+    # Convert results to DataFrame
+    df = pd.DataFrame(results)
+
+    # Filter for beta = 0.5 and scheme = "Two-Price"
+    df_filtered = df[df["beta"] == 0.5]
+
+    # Create simplified DataFrame for Two-Price only
+    df_two_price = pd.DataFrame({
+        "sample_size": df_filtered["sample_size"],
+        "Expected Profit (€)": df_filtered["expected_profit_one"],
+        "CVaR (€)": df_filtered["cvar_one"]
+    })
+
+    # Sort by sample size just in case
+    df_two_price = df_two_price.sort_values("sample_size")
+
+    # Filter for beta = 0.5
+    df_filtered = df[df["beta"] == 0.5]
+
+    # Create DataFrame for Two-Price only
+    df_two_price = pd.DataFrame({
+        "sample_size": df_filtered["sample_size"],
+        "Expected Profit (€)": df_filtered["expected_profit_one"],
+        "CVaR (€)": df_filtered["cvar_two"]
+    }).sort_values("sample_size")
+
+    if PLOT:
+        # --- Plot Expected Profit ---
+        plt.figure(figsize=(8, 5))
+        sns.lineplot(data=df_two_price, x="sample_size", y="Expected Profit (€)",
+                     marker="o", linewidth=2, color="steelblue")
+        plt.title("Expected Profit vs In-Sample Size (Two-Price, β = 0.5)", fontsize=16)
+        plt.xlabel("In-Sample Scenario Size", fontsize=20)
+        plt.ylabel("Expected Profit (€)", fontsize=20)
+        plt.xticks(fontsize=14)
+        plt.yticks(fontsize=14)
+        plt.grid(True)
+        plt.tight_layout()
+
+        # --- Plot CVaR ---
+        plt.figure(figsize=(8, 5))
+        sns.lineplot(data=df_two_price, x="sample_size", y="CVaR (€)",
+                     marker="o", linewidth=2, color="darkred")
+        plt.title("CVaR vs In-Sample Size (Two-Price, β = 0.5)", fontsize=16)
+        plt.xlabel("In-Sample Scenario Size", fontsize=20)
+        plt.ylabel("CVaR (€)", fontsize=20)
+        plt.xticks(fontsize=14)
+        plt.yticks(fontsize=14)
+        plt.grid(True)
+        plt.tight_layout()
+        #plt.show()  #Uncomment to show the plots
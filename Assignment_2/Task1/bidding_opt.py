@@ -0,0 +1,512 @@
+# =============================================================================
+# Wind Bidding Optimization: Shared Model and Solvers
+# -----------------------------------------------------------------------------
+# This module holds the bidding model shared by the Task 1 scripts
+# (Task_1.1_1.2_1.3.py and Task_1_4.py).
+#
+# Type:
+#     Linear optimization model (profit maximization), optionally with
+#     risk aversion (CVaR)
+#
+# Inputs:
+#     - Scenario arrays with hourly wind, DA price, and system imbalance (S x 24)
+#     - Pricing scheme ('one' or 'two') and, for CVaR, beta and alpha
+#
+# Outputs:
+#     - Optimal hourly offer quantities (MW)
+#     - Imbalances, objective value and CVaR variables of the solution
+# =============================================================================
+
+# =============================================================================
+# Imports and Initialization
+# =============================================================================
+from dataclasses import dataclass
+
+import gurobipy as gp
+from gurobipy import GRB
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import numba as nb
+except ImportError:  # solve_bidding falls back to the NumPy solver
+    nb = None
+
+max_capacity = 500  # Max bidding quantity in MW
+
+# Balancing price factors (relative to the DA price) indexed by the system flag
+# (0 = excess, 1 = deficit), for excess and deficit production per pricing scheme
+IMBALANCE_FACTORS = {
+    "one": (np.array([1.25, 0.85]), np.array([1.25, 0.85])),
+    "two": (np.array([1.00, 0.85]), np.array([1.25, 1.00])),
+}
+
+# =============================================================================
+# Step 1: Imbalance Price Coefficients and Scenario Revenue
+# =============================================================================
+def imbalance_coefficients(price_da, system, scheme):
+    """
+    Compute the balancing prices applied to excess and deficit production.
+
+    The revenue of a scenario-hour is then
+        price_da * bid + coef_exc * delta_exc - coef_def * delta_def
+
+    Parameters:
+        price_da (np.ndarray): Day-ahead prices (S x 24).
+        system (np.ndarray): System flags (S x 24), 1 = deficit, 0 = excess.
+        scheme (str): Pricing scheme used, either 'one' or 'two'.
+
+    Returns:
+        tuple of np.ndarray: coef_exc and coef_def, each (S x 24).
+    """
+    factors_exc, factors_def = IMBALANCE_FACTORS[scheme]
+    coef_exc = factors_exc[system] * price_da
+    coef_def = coef_exc if scheme == "one" else factors_def[system] * price_da
+    return coef_exc, coef_def
+
+
+def scenario_revenue(offer_quantities, wind, price_da, coef_exc, coef_def):
+    """
+    Revenue of a fixed hourly bid in every scenario and hour.
+
+    Parameters:
+        offer_quantities (array-like): 24 hourly bids (MW).
+        wind, price_da (np.ndarray): Scenario data (S x 24).
+        coef_exc, coef_def (np.ndarray): Imbalance prices from imbalance_coefficients (S x 24).
+
+    Returns:
+        np.ndarray: Revenue per scenario and hour (S x 24).
+    """
+    bid = np.asarray(offer_quantities, dtype=float)
+    imbalance = wind - bid
+    return (price_da * bid
+            + coef_exc * np.maximum(imbalance, 0)
+            - coef_def * np.maximum(-imbalance, 0))
+
+
+if nb is not None:
+    @nb.njit(cache=True, fastmath=True)
+    def solution_revenue_core(bid, price_da, coef_exc, coef_def, delta_exc, delta_def):
+        """
+        Numba version of solution_revenue, accumulating both totals in a single pass.
+
+        Parameters:
+            bid (np.ndarray): 24 hourly bids (MW).
+            price_da, coef_exc, coef_def (np.ndarray): DA and imbalance prices (S x 24).
+            delta_exc, delta_def (np.ndarray): Excess and deficit production (S x 24).
+
+        Returns:
+            tuple of np.ndarray: Profit per scenario (S,) and mean revenue per hour (24,).
+        """
+        n = price_da.shape[0]
+        profits = np.zeros(n)
+        hourly = np.zeros(24)
+        for s in range(n):
+            for t in range(24):
+                revenue = (price_da[s, t] * bid[t]
+                           + coef_exc[s, t] * delta_exc[s, t]
+                           - coef_def[s, t] * delta_def[s, t])
+                profits[s] += revenue
+                hourly[t] += revenue
+        return profits, hourly / n
+
+
+def solution_revenue(bid, price_da, coef_exc, coef_def, delta_exc, delta_def):
+    """
+    Profit per scenario and mean revenue per hour of a solved bidding model.
+
+    Parameters:
+        bid (array-like): 24 hourly bids (MW).
+        price_da, coef_exc, coef_def (np.ndarray): DA and imbalance prices (S x 24).
+        delta_exc, delta_def (np.ndarray): Excess and deficit production (S x 24).
+
+    Returns:
+        tuple of np.ndarray: Profit per scenario (S,) and mean revenue per hour (24,).
+    """
+    bid = np.asarray(bid, dtype=float)
+    if nb is not None:
+        return solution_revenue_core(bid, price_da, coef_exc, coef_def, delta_exc, delta_def)
+
+    # Row and column sums as matrix products, without forming the S x 24 revenue table
+    profits = (price_da @ bid
+               + np.einsum("st,st->s", coef_exc, delta_exc)
+               - np.einsum("st,st->s", coef_def, delta_def))
+    hourly = (price_da.sum(axis=0) * bid
+              + np.einsum("st,st->t", coef_exc, delta_exc)
+              - np.einsum("st,st->t", coef_def, delta_def)) / price_da.shape[0]
+    return profits, hourly
+
+
+@dataclass
+class BiddingResult:
+    """
+    Optimal bidding strategy and the values of the model variables.
+
+    Attributes:
+        offer (np.ndarray): Optimal offer quantity per hour (24,).
+        objective (float): Optimal objective value (expected profit if beta = 0).
+        delta_exc, delta_def (np.ndarray): Excess and deficit production (S x 24).
+        coef_exc, coef_def (np.ndarray): Imbalance prices used by the model (S x 24).
+        var (float): Value-at-Risk threshold (CVaR model only).
+        aux (np.ndarray): CVaR shortfall per scenario (CVaR model only).
+    """
+    offer: np.ndarray
+    objective: float
+    delta_exc: np.ndarray
+    delta_def: np.ndarray
+    coef_exc: np.ndarray
+    coef_def: np.ndarray
+    var: float = None
+    aux: np.ndarray = None
+
+# =============================================================================
+# Step 2: Expected-Profit Bidding (Closed Form)
+# =============================================================================
+def optimal_offers(wind, price_da, coef_exc, coef_def):
+    """
+    Solve the expected-profit bidding LP in closed form.
+
+    Substituting delta_exc - delta_def = wind - offer, the LP decouples into
+    24 independent problems in the hourly bid b:
+        max_b (1/S) * sum_s [p_s * b + c_exc_s * max(w_s - b, 0) - c_def_s * max(b - w_s, 0)]
+    This is concave and piecewise linear with breakpoints at the wind values
+    (c_def >= c_exc for non-negative prices), so the optimum is the first
+    breakpoint at which the slope becomes non-positive.
+
+    Parameters:
+        wind, price_da (np.ndarray): Scenario data (S x 24).
+        coef_exc, coef_def (np.ndarray): Imbalance prices from imbalance_coefficients (S x 24).
+
+    Returns:
+        np.ndarray: Optimal offer quantity per hour (24,).
+    """
+    # Sort scenarios by wind within each hour
+    order = np.argsort(wind, axis=0, kind="stable")
+    wind_sorted = np.take_along_axis(wind, order, axis=0)
+    exc_sorted = np.take_along_axis(coef_exc, order, axis=0)
+    def_sorted = np.take_along_axis(coef_def, order, axis=0)
+
+    # Slope of the hourly revenue just above b = 0 and above each sorted wind value
+    slope_zero = price_da.sum(axis=0) - coef_exc.sum(axis=0)
+    slope = slope_zero + np.cumsum(exc_sorted - def_sorted, axis=0)
+    candidates = np.vstack([np.zeros((1, 24)), wind_sorted])
+    slopes = np.vstack([slope_zero, slope])
+
+    # Optimum: first candidate where the revenue stops increasing, else full capacity
+    stop = slopes <= 0
+    first = np.argmax(stop, axis=0)
+    bids = np.where(stop.any(axis=0), candidates[first, np.arange(24)], max_capacity)
+    return np.clip(bids, 0, max_capacity)
+
+
+if nb is not None:
+    @nb.njit(parallel=True, cache=True)
+    def optimal_offers_core(wind, price_da, coef_exc, coef_def, capacity):
+        """
+        Numba version of optimal_offers, solving the 24 hourly problems in parallel.
+
+        Parameters:
+            wind, price_da (np.ndarray): Scenario data (S x 24).
+            coef_exc, coef_def (np.ndarray): Imbalance prices from imbalance_coefficients (S x 24).
+            capacity (float): Maximum bid (MW).
+
+        Returns:
+            np.ndarray: Optimal offer quantity per hour (24,).
+        """
+        bids = np.empty(24)
+        for t in nb.prange(24):
+            # Slope of the hourly revenue just above b = 0
+            slope = price_da[:, t].sum() - coef_exc[:, t].sum()
+            bid = 0.0
+            if slope > 0:
+                # Walk up the sorted wind values until the revenue stops increasing
+                bid = capacity
+                for s in np.argsort(wind[:, t]):
+                    slope += coef_exc[s, t] - coef_def[s, t]
+                    if slope <= 0:
+                        bid = wind[s, t]
+                        break
+            bids[t] = min(max(bid, 0.0), capacity)
+        return bids
+
+# =============================================================================
+# Step 3: CVaR Bidding (Gurobi Model Template)
+# =============================================================================
+# Cached Gurobi model for the most recent scenario set
+_model_cache = []
+
+# Smallest share of a cached model's scenarios that is solved on that model. The
+# switched-off scenarios stay in the LP (presolve is off after the first solve), so
+# smaller in-sample sets are solved on a model of their own
+REUSE_MIN_SHARE = 0.5
+
+# Gurobi environment shared by all models of this process
+_env = None
+
+def get_gurobi_env():
+    """
+    Return the Gurobi environment of this process, starting it on first use.
+
+    A single environment means a single license check per process. Output is
+    disabled before the environment starts, so Gurobi stays silent from the start.
+
+    Returns:
+        gp.Env: The started Gurobi environment.
+    """
+    global _env
+    if _env is None:
+        _env = gp.Env(empty=True)
+        _env.setParam("OutputFlag", 0)
+        _env.start()
+    return _env
+
+
+def build_gurobi_model(wind):
+    """
+    Create a Gurobi model for wind bidding optimization with CVaR-based risk management.
+
+    The variables are matrix variables (MVar) with one row per scenario, so the imbalance
+    balance is added as a single matrix constraint. The scheme-dependent CVaR
+    constraints and the objective coefficients are set by set_cvar_constraints and
+    solve_bidding.
+    The variables are stored on the model as _offer, _delta_exc, _delta_def, _var and _aux,
+    and all of them in column order as _all_vars.
+
+    Parameters:
+        wind (np.ndarray): In-sample wind production in MW (S x 24).
+
+    Returns:
+        gp.Model: A Gurobi model with variables and imbalance constraints (excluding objective).
+    """
+    n = wind.shape[0]
+    model = gp.Model("cvar_bidding", env=get_gurobi_env())
+    model.Params.Method = 1  # Dual simplex instead of the concurrent LP default
+    model.Params.Threads = 1
+    model.Params.Presolve = 1
+    model.Params.LPWarmStart = 2  # Reuse the basis of the previous solve after model changes
+
+    # Variables and constraints are left unnamed: the model is only accessed through the
+    # MVars stored on it, and generating names for every scenario-hour costs build time
+
+    # Decision variable: DA offer quantity per hour (bounded by max capacity)
+    offer = model.addMVar(24, lb=0, ub=max_capacity)
+
+    # Positive and negative parts of the imbalance (wind - offer)
+    delta_exc = model.addMVar((n, 24), lb=0)  # Excess (overproduction)
+    delta_def = model.addMVar((n, 24), lb=0)  # Deficit (underproduction)
+
+    # CVaR components: VaR threshold and auxiliary shortfall variables
+    var = model.addMVar(1, lb=0)
+    aux = model.addMVar(n, lb=0)
+
+    model._offer = offer
+    model._delta_exc, model._delta_def = delta_exc, delta_def
+    model._var, model._aux = var, aux
+
+    # All variables in column order (offer, delta_exc, delta_def, VaR, auxiliary)
+    model.update()
+    model._all_vars = gp.MVar.fromlist(model.getVars())
+
+    # Constraint: delta_exc - delta_def = wind - offer, one row per scenario-hour.
+    # The coefficient matrix is assembled directly instead of from a matrix expression
+    rows = n * 24
+    offer_block = sp.csr_matrix((np.ones(rows), (np.arange(rows), np.arange(rows) % 24)), shape=(rows, 24))
+    A = sp.hstack([
+        offer_block,
+        sp.identity(rows),
+        -sp.identity(rows),
+        sp.csr_matrix((rows, 1 + n)),  # VaR and auxiliary variables do not appear
+    ], format="csr")
+    model.addMConstr(A, model._all_vars, "=", wind.ravel())
+    model._cvar_constrs = None
+    model._scheme = None  # Pricing scheme of the current CVaR constraints
+    model._coefs = {}  # Imbalance prices of the sample per pricing scheme
+    model._active = np.ones(n, dtype=bool)  # Scenarios in the objective and CVaR
+
+    # Maximize; the objective coefficients are set per solve in solve_bidding
+    model.ModelSense = GRB.MAXIMIZE
+    return model
+
+
+def set_cvar_constraints(model, price_da, coef_exc, coef_def, scheme):
+    """
+    (Re)build the scheme-dependent CVaR constraints of a cached model.
+
+    Existing CVaR constraints are removed first, so the same model can be reused for
+    the one- and two-price schemes. If the model already holds the constraints of
+    this scheme, nothing is changed and only the objective differs between solves.
+
+    Parameters:
+        model (gp.Model): Model created by build_gurobi_model.
+        price_da (np.ndarray): Day-ahead prices of the in-sample scenarios (S x 24).
+        coef_exc, coef_def (np.ndarray): Imbalance prices of the pricing scheme (S x 24).
+        scheme (str): Pricing scheme of coef_exc and coef_def, 'one' or 'two'.
+    """
+    if model._scheme == scheme:
+        return
+    if model._cvar_constrs is not None:
+        model.remove(model._cvar_constrs)
+
+    # CVaR constraint: auxiliary ≥ VaR - scenario profit (for each scenario), written as
+    #   price_da[s] @ offer + coef_exc[s] @ delta_exc[s] - coef_def[s] @ delta_def[s] - VaR + auxiliary[s] ≥ 0
+    # The coefficient matrix is assembled directly from the arrays instead of
+    # building a linear expression per scenario
+    n = price_da.shape[0]
+    rows = np.arange(0, n * 24 + 1, 24)  # Scenario s owns columns s*24 ... s*24+23
+
+    def per_scenario(coef):
+        return sp.csr_matrix((coef.ravel(), np.arange(n * 24), rows), shape=(n, n * 24))
+
+    A = sp.hstack([
+        sp.csr_matrix(price_da),
+        per_scenario(coef_exc),
+        -per_scenario(coef_def),
+        -np.ones((n, 1)),
+        sp.identity(n),
+    ], format="csr")
+    model._cvar_constrs = model.addMConstr(A, model._all_vars, ">", np.zeros(n))
+    model._scheme = scheme
+
+
+def get_cached_model(wind, price, system):
+    """
+    Return the Gurobi model for a scenario set.
+
+    The model is built once per scenario set and reused across pricing schemes, risk
+    aversion levels and in-sample subsets (switched on by set_active_scenarios). The
+    template only depends on the wind data, but the CVaR constraints kept on it also
+    depend on prices and system flags, so the whole set has to match. Only the most
+    recent model is kept to hold a single Gurobi model in memory. Arrays that are the
+    stored arrays themselves are matched without comparing their contents.
+
+    Parameters:
+        wind, price, system (np.ndarray): Wind, DA price and system flags (S x 24).
+
+    Returns:
+        gp.Model: Model created by build_gurobi_model, with its scenarios stored as _sample.
+    """
+    sample = (wind, price, system)
+    for model in _model_cache:
+        if all(
+            data is cached or np.array_equal(cached, data)
+            for cached, data in zip(model._sample, sample)
+        ):
+            return model
+
+    for model in _model_cache:
+        model.dispose()
+    _model_cache.clear()
+    model = build_gurobi_model(wind)
+    model._sample = (wind, price, system)
+    _model_cache.append(model)
+    return model
+
+
+def set_active_scenarios(model, active):
+    """
+    Restrict the CVaR constraints of a cached model to a subset of its scenarios.
+
+    The auxiliary variables of the other scenarios become free, so their CVaR
+    constraints can always be met. Together with zero objective coefficients (set in
+    solve_bidding) these scenarios then have no effect on the solution.
+
+    Parameters:
+        model (gp.Model): Model returned by get_cached_model.
+        active (np.ndarray): Boolean mask of the in-sample scenarios (S,).
+    """
+    if np.array_equal(model._active, active):
+        return
+    model._aux.LB = np.where(active, 0.0, -GRB.INFINITY)
+    model._active = active
+
+# =============================================================================
+# Step 4: Solve Bidding Problem
+# =============================================================================
+def solve_bidding(wind, price, system, scheme, cvar=False, beta=0.0, alpha=0.90, active=None):
+    """
+    Solve the wind bidding problem for a given pricing scheme.
+
+    Without CVaR the expected-profit LP is solved in closed form (with Numba if
+    available). With CVaR the objective is the weighted sum
+        (1 - beta) * expected profit + beta * CVaR_alpha
+    and the LP is solved with Gurobi on a cached model template.
+
+    Parameters:
+        wind, price, system (np.ndarray): Wind, DA price and system flags (S x 24).
+        scheme (str): 'one' or 'two' for one-price or two-price imbalance pricing.
+        cvar (bool): If True, solve the CVaR-based model with Gurobi.
+        beta (float): Risk aversion level (0 = risk-neutral, 1 = fully risk-averse).
+        alpha (float): CVaR quantile (default is 0.90 for 90% confidence).
+        active (np.ndarray, optional): Boolean mask (S,) of the in-sample scenarios;
+            all scenarios by default. Lets a sweep over in-sample sets of one
+            scenario set share a single Gurobi model.
+
+    Returns:
+        BiddingResult: Optimal bids, objective value and variable values, the
+            scenario arrays restricted to the in-sample scenarios.
+    """
+    if active is not None:
+        n_total = wind.shape[0]
+        if not cvar or active.sum() < REUSE_MIN_SHARE * n_total:
+            # Small subsets (and the closed form) are solved on their own scenarios
+            return solve_bidding(wind[active], price[active], system[active], scheme, cvar, beta, alpha)
+
+    if not cvar:
+        coef_exc, coef_def = imbalance_coefficients(price, system, scheme)
+        if nb is not None:
+            offer = optimal_offers_core(wind, price, coef_exc, coef_def, float(max_capacity))
+        else:
+            offer = optimal_offers(wind, price, coef_exc, coef_def)
+        imbalance = wind - offer
+        delta_exc = np.maximum(imbalance, 0)
+        delta_def = np.maximum(-imbalance, 0)
+        revenue = price * offer + coef_exc * delta_exc - coef_def * delta_def
+        return BiddingResult(offer, revenue.sum(axis=1).mean(), delta_exc, delta_def, coef_exc, coef_def)
+
+    # Reuse the model template for this scenario set, switch on the in-sample scenarios and
+    # swap in the scheme's CVaR constraints (kept as they are when only beta changes)
+    n_total = wind.shape[0]
+    if active is None:
+        active = np.ones(n_total, dtype=bool)
+    n = int(active.sum())
+    model = get_cached_model(wind, price, system)
+    if scheme not in model._coefs:
+        model._coefs[scheme] = imbalance_coefficients(price, system, scheme)
+    coef_exc, coef_def = model._coefs[scheme]
+    set_cvar_constraints(model, price, coef_exc, coef_def, scheme)
+    set_active_scenarios(model, active)
+
+    # Define the CVaR-based objective function: weighted sum of expected profit and downside risk.
+    # The linear coefficients are written straight into the Obj attribute of the variables,
+    # so no objective expression has to be built and parsed by Gurobi.
+    # Scenarios outside the in-sample set get a zero weight.
+    weight = (1 - beta) / n
+    model._offer.Obj = weight * price[active].sum(axis=0)
+    model._delta_exc.Obj = weight * coef_exc * active[:, None]
+    model._delta_def.Obj = -weight * coef_def * active[:, None]
+    model._var.Obj = beta
+    model._aux.Obj = -beta / ((1 - alpha) * n) * active
+
+    # Solve the model; Gurobi keeps the previous basis as a warm start
+    model.optimize()
+    if model.Status != GRB.OPTIMAL:
+        raise RuntimeError(f"Gurobi did not solve the bidding model to optimality (status {model.Status})")
+
+    # Later solves of this model only differ in objective, bounds or the CVaR rows:
+    # skip presolve so dual simplex starts directly from the optimal basis found here
+    model.Params.Presolve = 0
+
+    # Fetch all primal values at once and split them in column order
+    x = model._all_vars.X
+    exc_end = 24 + n_total * 24
+    def_end = exc_end + n_total * 24
+    return BiddingResult(
+        offer=x[:24],
+        objective=model.ObjVal,
+        delta_exc=x[24:exc_end].reshape(n_total, 24)[active],
+        delta_def=x[exc_end:def_end].reshape(n_total, 24)[active],
+        coef_exc=coef_exc[active],
+        coef_def=coef_def[active],
+        var=x[def_end],
+        aux=x[def_end + 1:][active],
+    )
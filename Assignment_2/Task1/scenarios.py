@@ -1,11 +1,23 @@
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 
-# Set working directory to the location of this script
-import os
+# Input data and caches live next to this script, independent of the working directory
+DATA_DIR = Path(__file__).resolve().parent
 
-# Set the working directory to the script's directory
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+# Cache of the combined scenarios and the files it is built from. This module is
+# included so that changes to the generation (seed, p_deficit, wind_capacity, the
+# combination logic) also invalidate the cache, not only changes to the input data
+CACHE_FILE = DATA_DIR / "scenarios_cache.npz"
+WIND_FILE = DATA_DIR / "wind_data.xlsx"
+PRICE_FILE = DATA_DIR / "price_data_zeroed.xlsx"
+SOURCE_FILES = (WIND_FILE, PRICE_FILE, Path(__file__).resolve())
 
 
 def generate_power_scenarios(num_scenarios, p_deficit=0.5, seed=None):
@@ -27,9 +39,85 @@ def generate_power_scenarios(num_scenarios, p_deficit=0.5, seed=None):
     return scenarios
 
 
-def read_data(filename, sheet_name=0):
-    # Excel-Datei einlesen
-    df = pd.read_excel(filename, sheet_name=sheet_name)
+@contextmanager
+def _atomic_path(target):
+    """
+    Yield a temporary path next to target and move it onto target once written.
+
+    The file only appears under its final name when it is complete, so an
+    interrupted run or two runs writing at the same time never leave a truncated
+    cache behind. The temporary file is removed if writing fails.
+
+    Parameters:
+    - target (Path): Final path of the file
+
+    Yields:
+    - Path: Temporary path in the same directory, with the same suffix as target
+    """
+    target = Path(target)
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=target.stem + ".", suffix=target.suffix)
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, target)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _ensure_csv(xlsx_path, sheet_name=0, force=False):
+    """
+    Convert an Excel sheet once to a CSV file next to it.
+
+    The CSV is rewritten whenever the Excel file is newer, so edits to the
+    workbook are picked up on the next run. It is written atomically, so a
+    CSV under the final name is always complete.
+
+    Parameters:
+    - xlsx_path (Path): Path of the Excel file
+    - sheet_name (int or str): Sheet to convert (default: first sheet)
+    - force (bool): Rewrite the CSV even if it is up to date
+
+    Returns:
+    - Path: Path of the CSV file
+    """
+    xlsx_path = Path(xlsx_path)
+    suffix = ".csv" if sheet_name == 0 else f"_{sheet_name}.csv"
+    csv_path = xlsx_path.with_name(xlsx_path.stem + suffix)
+    if force or not csv_path.exists() or csv_path.stat().st_mtime < xlsx_path.stat().st_mtime:
+        with _atomic_path(csv_path) as tmp_path:
+            pd.read_excel(xlsx_path, sheet_name=sheet_name).to_csv(tmp_path, index=False)
+    return csv_path
+
+
+def _read_csv_rows(csv_path, n_rows):
+    """
+    Read a cached CSV and check that it holds n_rows complete rows.
+
+    Parameters:
+    - csv_path (Path): Path of the CSV file
+    - n_rows (int): Expected number of data rows
+
+    Returns:
+    - pd.DataFrame or None: The data, or None if the file is unreadable or incomplete
+    """
+    try:
+        df = pd.read_csv(csv_path)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError):
+        return None
+    if len(df) != n_rows or df.isna().any(axis=None):
+        return None
+    return df
+
+
+def read_data(filename, sheet_name=0, n_rows=24):
+    # Excel-Datei einlesen (einmalig als CSV zwischengespeichert, eine Zeile pro Stunde)
+    df = _read_csv_rows(_ensure_csv(filename, sheet_name), n_rows)
+    if df is None:
+        # Damaged CSV cache (e.g. an interrupted write): convert the workbook again
+        df = _read_csv_rows(_ensure_csv(filename, sheet_name, force=True), n_rows)
+    if df is None:
+        raise ValueError(f"{filename} does not contain {n_rows} complete rows")
     
     # Entferne die erste Spalte (Zeitdaten)
     df = df.iloc[:, 1:]
@@ -42,6 +130,48 @@ def read_data(filename, sheet_name=0):
     
     return columns_as_lists
 
+@dataclass
+class ScenarioSet:
+    """
+    Combined scenarios stored as arrays, one row per scenario and one column per hour.
+
+    Attributes:
+    - wind (np.ndarray): Wind production in MW (N x 24)
+    - price_da (np.ndarray): Day-ahead prices (N x 24)
+    - price_bal (np.ndarray): Balancing prices (N x 24)
+    - system (np.ndarray): System condition flags, 1 = deficit, 0 = excess (N x 24),
+      stored as uint8
+    """
+    wind: np.ndarray
+    price_da: np.ndarray
+    price_bal: np.ndarray
+    system: np.ndarray
+
+    def __post_init__(self):
+        # One byte per flag instead of eight; the flags index the price factor tables directly
+        self.system = np.asarray(self.system, dtype=np.uint8)
+
+    def __len__(self):
+        return self.wind.shape[0]
+
+    def subset(self, indices):
+        """
+        Select scenarios by index (a slice returns views, an index array returns copies).
+
+        Parameters:
+        - indices (slice or array-like of int): Scenarios to select
+
+        Returns:
+        - ScenarioSet: The selected scenarios
+        """
+        return ScenarioSet(
+            wind=self.wind[indices],
+            price_da=self.price_da[indices],
+            price_bal=self.price_bal[indices],
+            system=self.system[indices],
+        )
+
+
 def create_combined_scenarios(price_data_da, wind_data, power_scenarios, wind_capacity=500):
     """
     Combine price, wind, and power scenarios into a full scenario tree.
@@ -52,44 +182,77 @@ def create_combined_scenarios(price_data_da, wind_data, power_scenarios, wind_ca
     - power_scenarios (np.ndarray): 4 power scenarios, shape (4 x 24)
     
     Returns:
-    - list of dicts: 1600 scenarios, each with keys 'price', 'wind', 'power'
-    """
-    scenarios = []
-
-
-    for i, price_da in enumerate(price_data_da):
-        for j, wind in enumerate(wind_data):
-            for k, power in enumerate(power_scenarios):
-                power_list = power.tolist()  # Numpy -> Python list
-                
-                # Create balancing prices
-                balancing_prices = [
-                    price_da[t] * 0.85 if power_list[t] == 1 else price_da[t] * 1.25
-                    for t in range(24)
-                ]
-
-                scenario = {
-                    'wind': [w * wind_capacity for w in wind],  # Scale wind data to MW
-                    'price_da': price_da,
-                    'price_bal': balancing_prices,
-                    'system': power_list,   
-
-                }
-                scenarios.append(scenario)
-    
-    return scenarios
+    - ScenarioSet: 1600 scenarios with wind, price_da, price_bal and system arrays
+    """
+    price_arr = np.asarray(price_data_da, dtype=np.float64)                # (20 x 24)
+    wind_arr = np.asarray(wind_data, dtype=np.float64) * wind_capacity     # (20 x 24), scaled to MW
+    power_arr = np.asarray(power_scenarios, dtype=np.uint8)                # (4 x 24)
+    shape = (len(price_arr), len(wind_arr), len(power_arr), 24)
+
+    # Cartesian product price x wind x power, one row per combined scenario
+    price_all = np.broadcast_to(price_arr[:, None, None, :], shape).reshape(-1, 24)
+    wind_all = np.broadcast_to(wind_arr[None, :, None, :], shape).reshape(-1, 24)
+    system_all = np.broadcast_to(power_arr[None, None, :, :], shape).reshape(-1, 24)
+
+    # Create balancing prices
+    price_bal_all = np.where(system_all == 1, 0.85, 1.25) * price_all
+
+    return ScenarioSet(wind=wind_all, price_da=price_all, price_bal=price_bal_all, system=system_all)
+
+def load_cached_scenarios(cache_file=CACHE_FILE, source_files=SOURCE_FILES):
+    """
+    Load combined scenarios from the .npz cache written by save_cached_scenarios.
+
+    Parameters:
+    - cache_file (Path): Path of the cache file
+    - source_files (tuple of Path): Input files the cache was built from
+
+    Returns:
+    - ScenarioSet or None: Cached scenarios, or None if the cache is missing,
+      unreadable or older than any of the source files (including this module)
+    """
+    cache_file = Path(cache_file)
+    if not cache_file.exists():
+        return None
+    cache_time = cache_file.stat().st_mtime
+    if any(Path(f).stat().st_mtime > cache_time for f in source_files):
+        return None
+
+    # A damaged or incomplete cache is treated as missing, so it is rebuilt and replaced
+    try:
+        with np.load(cache_file) as cached:
+            return ScenarioSet(**{f.name: cached[f.name] for f in fields(ScenarioSet)})
+    except (zipfile.BadZipFile, KeyError, ValueError, EOFError, OSError):
+        return None
+
+
+def save_cached_scenarios(scenarios, cache_file=CACHE_FILE):
+    """
+    Save combined scenarios as compressed arrays for fast reloading.
+
+    Parameters:
+    - scenarios (ScenarioSet): Scenarios to save
+    - cache_file (Path): Path of the cache file
+    """
+    with _atomic_path(cache_file) as tmp_path:
+        np.savez_compressed(tmp_path, **{f.name: getattr(scenarios, f.name) for f in fields(scenarios)})
+
 
 def main():
-    # Load input data (each as list of 20 columns, each column = 24 hours)
-    wind_data = read_data("wind_data.xlsx")       # Expected: 20 wind scenarios
-    price_data = read_data("price_data_zeroed.xlsx")     # Expected: 20 price scenarios
+    # Reuse the scenarios of a previous run unless the input data or this module changed
+    all_scenarios = load_cached_scenarios()
 
-    
-    # Generate 4 power scenarios (binary 0/1 per hour)
-    power_scenarios = generate_power_scenarios(4, p_deficit=0.5, seed=42)
+    if all_scenarios is None:
+        # Load input data (each as list of 20 columns, each column = 24 hours)
+        wind_data = read_data(WIND_FILE)       # Expected: 20 wind scenarios
+        price_data = read_data(PRICE_FILE)     # Expected: 20 price scenarios
+
+        # Generate 4 power scenarios (binary 0/1 per hour)
+        power_scenarios = generate_power_scenarios(4, p_deficit=0.5, seed=42)
 
-    # Combine into 1600 total scenarios: 20 * 20 * 4
-    all_scenarios = create_combined_scenarios(price_data, wind_data, power_scenarios)
+        # Combine into 1600 total scenarios: 20 * 20 * 4
+        all_scenarios = create_combined_scenarios(price_data, wind_data, power_scenarios)
+        save_cached_scenarios(all_scenarios)
 
     print(f"Generated {len(all_scenarios)} combined scenarios.")  # Should be 1600
     return all_scenarios
@@ -101,4 +264,4 @@ if __name__ == "__main__":
 
     # Print first scenario for verification
     print("First scenario:")
-    print(all_scenarios[0])
+    print(all_scenarios.subset(0))